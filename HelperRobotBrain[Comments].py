@@ -1,4 +1,7 @@
 import math  # Standard math import for using angles
+import random  # Standard random import for drawing behaviors
+from bisect import bisect_right  # Binary search over cumulative probabilities
+from itertools import accumulate  # Running sums for cumulative probabilities
 ## Special imports from class libraries ##
 from soar.robot.pioneer import PioneerRobot  # Robot controller
 from soar.robot.arcos import *  # Robot functions
@@ -19,77 +22,153 @@ def random_behavior(prev_behav='stay', near_wall=False):
     ## Continue search if we are already searching ##
     if prev_behav == 'search':
         return 'search'
-    ## If we are near a wall, force behavior to give us 'turn' ##
+    ## If we are near a wall, turn. Conditioning behavior on turning can only give 'turn' ##
     elif near_wall:
-        return behavior.condition(lambda x: x not in ('frwd', 'search', 'stay')).draw()
+        return 'turn'
     ## If the previos behavior was the same as the highest probability behavior, we update
     ## the distribution in a way that initially favors the highest probability but declines
     ## over time if the behavior stays the same ##
-    elif prev_behav == behavior.max_prob_elt():
-        behav_elts = behavior.support()  # Returns a list of potential outputs of behavior
-        behav_elts.remove(prev_behav)  # Removes the previous behavior from that list
-        uni_dist = uniform_dist(behav_elts)  # Creates a new uniform distribution over the new list
+    elif prev_behav == behavior_max_elt:
+        ## Uniform distribution over the potential outputs of behavior, without the previous behavior ##
+        uni_dist = UNIFORM_WITHOUT[prev_behav]
         ## Mixes the current behavior distribution with the new uniform one, weighting the
-        ## current distribution so that the two are equally likely after 5000 timesteps ##
-        behavior = mixture(behavior, uni_dist, (10000 - consecutives) / 10000)
-        return behavior.draw()  # Draws and returns a new behavior
+        ## current distribution so that the two are equally likely after 5000 timesteps. After
+        ## 10000 timesteps the weight would reach zero, so behavior just becomes the uniform one ##
+        if consecutives >= 10000:
+            set_behavior(uni_dist)
+        else:
+            mix_behavior(uni_dist, (10000 - consecutives) / 10000)
+        return draw_behavior()  # Draws and returns a new behavior
     ## If the previous behavior wasn't the highest probability behavior, update the
     ## distribution to favor a new chain of behaviors ##
     else: 
         ## Creates a new distribution with all probability mass on the previous behavior ##
-        peak_dist = delta_dist(prev_behav)
+        peak_dist = PEAK_DISTS[prev_behav]
         ## Mixes the current behavior distribution with the new spiked one, weighting the 
         ## current distribution so that it is 1/10 as likely as the spiked distribution. After
         ## four timesteps, the two distributions are equally likely, and after nine, the behavior
         ## won't change. This is to encourage picking a high probability behavior initially, 
         ## but allowing the specific probability mass to sort itself out if it chooses a low 
-        ## probability outcome several times in a row ##
-        behavior = mixture(behavior, peak_dist, min((consecutives + 1) / 10, 1))
-        return behavior.draw()  # Draws and returns a new behavior
+        ## probability outcome several times in a row. Once the weight reaches 1 mixing leaves
+        ## behavior as it is, so it is skipped ##
+        if consecutives < 9:
+            mix_behavior(peak_dist, (consecutives + 1) / 10)
+        return draw_behavior()  # Draws and returns a new behavior
+
+def behavior_probs(dist):
+    '''
+    returns the probabilities a DDist assigns to each behavior, in the same order as
+    BEHAVIORS. this is how behavior distributions are stored so they can be mixed and
+    drawn from without going through DDist.
+    args: DDist
+    ret: tuple
+    '''
+    return tuple(dist.prob(x) for x in BEHAVIORS)
+
+def mix_behavior(other, p):
+    '''
+    mixes the global behavior distribution with another behavior distribution,
+    choosing behavior with probability p and other with probability 1 - p, the
+    same way mixture does for DDists.
+    args: tuple, double
+    ret: 
+    '''
+    q = 1 - p
+    set_behavior(tuple(p * x + q * y for x, y in zip(behavior, other)))
+
+def set_behavior(new_behavior):
+    '''
+    replaces the global behavior distribution and refreshes the values cached from
+    it, so they are only recomputed when the distribution actually changes.
+    args: tuple
+    ret: 
+    '''
+    global behavior
+    global behavior_max_elt
+    global behavior_cumulative
+    behavior = new_behavior
+    behavior_max_elt = BEHAVIORS[new_behavior.index(max(new_behavior))]  # Most likely behavior
+    behavior_cumulative = tuple(accumulate(new_behavior))  # Running totals used by draw_behavior
+
+def draw_behavior():
+    '''
+    draws a random behavior from the global behavior distribution. uses the
+    cumulative probabilities cached by set_behavior, so each draw is one random
+    number and a binary search.
+    args: 
+    ret: string
+    '''
+    index = bisect_right(behavior_cumulative, random.random())
+    ## Rounding can leave the last running total slightly below 1, so clamp to the last behavior ##
+    return BEHAVIORS[min(index, len(BEHAVIORS) - 1)]
 
-def is_near_wall():
+def is_near_wall(sonars):
     '''
     checks to see if the robot is too close to a wall or another object based on
     its sonar readings from the middle six sonars. returns True if the robot 
     is within the defined wall_dist, False if it is farther away.
-    args: 
+    args: list
     ret: boolean
     '''
-    global robot
-    sonars = robot.sonars  # Accesses sonar data
-    ## Checks to see if any of the sensors is close enough to warrant a close reading ##
-    return any([sonars[x] < WALL_DISTANCE for x in range(1, 6) if sonars[x] != None])
+    ## Checks to see if any of the sensors is close enough to warrant a close reading, stopping
+    ## at the first one. Sensors with no reading return None and are skipped ##
+    for distance in sonars[1:6]:
+        if distance is not None and distance < WALL_DISTANCE:
+            return True
+    return False
  
-def update_voltage_values():
+def step_simulated():
     '''
-    updates the global voltage_values list based on the current readings from the robot analogs.
-    returns average value of the voltages in the list
+    runs one timestep of random movement on a simulated robot. the simulator has no
+    mics, so this skips the analog reads and voltage updates and never starts a search.
     args: 
+    ret: 
+    '''
+    global consecutives
+    global prev_behav
+    this_behavior = random_behavior(prev_behav, is_near_wall(robot.sonars))
+    consecutives = consecutives + 1 if prev_behav == this_behavior else 0
+    (robot.fv, robot.rv) = BEHAVIOR_DICT[this_behavior] # Sets robots movement based on its new behavior
+    prev_behav = this_behavior
+
+def update_voltage_values(front, back):
+    '''
+    updates the global voltage_values ring buffer based on the current readings from the
+    front and back mics. returns average value of the voltages in the buffer
+    args: double, double
     returns: double
     '''
     global voltage_values
-    global robot
-    front, _2, _3, back = robot.analogs  # Unpack robot analog values from front and back mics
-    voltage_values.append(max(front, back))  # Adds the higher mic input value
-    voltage_values.pop(0)  # Removes the oldest value
-    return sum(voltage_values) / len(voltage_values)  # Returns the average of the voltage values
+    global voltage_index
+    global voltage_sum
+    new_value = max(front, back)  # Keeps the higher mic input value
+    ## Overwrites the oldest value and updates the running sum instead of re-adding the list ##
+    voltage_sum += new_value - voltage_values[voltage_index]
+    voltage_values[voltage_index] = new_value
+    voltage_index = (voltage_index + 1) % VOLTAGE_WINDOW  # Oldest value is now in the next slot
+    return voltage_sum * VOLTAGE_WINDOW_INV  # Returns the average of the voltage values
+
+def belief_step(ptheta, index):
+    '''
+    checks whether the robot has rotated to the location at the given index during
+    a search. returns the index of the next location to record and True if the robot
+    is at an observable angle, or the same index and False if it still has to turn.
+    args: double, int
+    ret: tuple(int, boolean)
+    '''
+    if abs(ptheta - locations[index]) > ANGLE_TOL:  # Still turning toward the location
+        return index, False
+    return index + 1, True
 
-def update_loc_obs():
+def most_likely_location():
     '''
-    provides a DDist for the probability of a sound coming from a certain spot
-    given a certain observation set. normalizes voltage values to create probability
-    distribution
+    returns the index of the location with the highest probability in the
+    robot's belief of what direction the sound is coming from.
     args: 
-    ret: DDist
+    ret: int
     '''
-    global loc_dict # Calls loc_dict for access to radian values and voltage values
-    peak = sum(loc_dict.values()) # Sums voltage values
-    ## Returns a new probability distribution that uses the voltages recorded at each position
-    ## as the probability the other robot is at that position (voltages are normalized first).
-    ## For example, if the loudest sound is at pi radians, the robot will read the highest voltage
-    ## there and then assign that the highest probability mass by dividing all voltage values
-    ## by their sum. ##
-    return DDist({x: y / peak for x, y in zip(loc_dict.keys(), loc_dict.values())})
+    global belief_probs
+    return max(range(NUMBER_LOCATIONS), key=belief_probs.__getitem__)
 
 
 
@@ -109,35 +188,68 @@ SENSORS_ON = 1 # 0 for False, 1 for True
 ## The initial distribution for robot behaviors. Does not include search because search
 ## is an induced behavior rather than a random one ##
 INIT_BEHAV = DDist({'stay': 0.34, 'frwd': 0.33, 'turn': 0.33})
+## Tuple of every behavior random_behavior can pick. Behavior distributions are stored as tuples
+## of probabilities in this order ##
+BEHAVIORS = tuple(INIT_BEHAV.support())
+## Uniform distributions over every behavior but one, and distributions with all probability
+## mass on one behavior, keyed by that behavior. The behaviors never change, so these are
+## built once instead of on every call to random_behavior ##
+UNIFORM_WITHOUT = {b: behavior_probs(uniform_dist([x for x in BEHAVIORS if x != b])) for b in BEHAVIORS}
+PEAK_DISTS = {b: behavior_probs(delta_dist(b)) for b in BEHAVIORS}
+## Probabilities of the initial distribution, in the form behavior is stored in ##
+INIT_BEHAV_PROBS = behavior_probs(INIT_BEHAV)
 ## Double that allows us to set the distance we want the robot to keep from any walls ##
 WALL_DISTANCE = 0.5
-## Double that sets our angle tolerance for the robot ##
-ANGLE_TOL = 2 * pi / (half_length * 20)
 ## Number of discrete locations to record observations from ##
 NUMBER_LOCATIONS = 16
+## Number of previous mic values that are averaged to detect a sound ##
+VOLTAGE_WINDOW = 10
+## Reciprocal of VOLTAGE_WINDOW, so averaging the window is a multiplication instead of a division ##
+VOLTAGE_WINDOW_INV = 1 / VOLTAGE_WINDOW
+## Double that sets our angle tolerance for the robot ##
+ANGLE_TOL = 2 * pi / (NUMBER_LOCATIONS * 10)
 
 ## Behavior variable that is passed around functions. Initialized to inital probability distribution ##
-behavior = INIT_BEHAV
+behavior = INIT_BEHAV_PROBS
+## Values cached from behavior by set_behavior, which fills them in from the initial distribution ##
+behavior_max_elt = None
+behavior_cumulative = ()
+set_behavior(INIT_BEHAV_PROBS)
 ## Integer that keeps track of the number of consective movements to help create a more
 ## realistic movement model ##
 consecutives = 0
 ## Initializes previous behavior variable. Set to 'search' to immediately initiate search ##
 prev_behav = 'stay'
+## Boolean that is True when connected to a real robot. Set once in on_load, since it can't
+## change while the brain is running ##
+real_robot = False
 ## Integer that tracks which how many revolutions the robot has completed. One full observation
 ## cycle is two rotations $$
 to_search = 0
-## List that tracks the previous 10 front and rear mic values to detect if the other robot is making a sound
-voltage_values = [0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
-## List of locations in ascending order of radians ##
-locations = [x / (NUMBER_LOCATIONS / 2) * pi for x in range(0, NUMBER_LOCATIONS)]
-## Dictionary with all the radian values of locations. For storing intermediate reading values ##
-loc_dict = {x: 0 for x in locations}
-## DDist that represents the robot's belief of what direction the sound is coming from ##
-loc_belief = uniform_dist(locations)
+## Ring buffer that tracks the previous 10 front and rear mic values to detect if the other robot
+## is making a sound, along with the slot holding the oldest value and the sum of all the values ##
+voltage_values = [0] * VOLTAGE_WINDOW
+voltage_index = 0
+voltage_sum = 0
+## Tuple of locations in ascending order of radians. Locations are only ever looked up by index,
+## never by angle, since readings drift away from these exact values ##
+locations = tuple(x / (NUMBER_LOCATIONS / 2) * pi for x in range(0, NUMBER_LOCATIONS))
+## List of the voltage read at each location, indexed the same way as locations. For storing
+## intermediate reading values ##
+loc_voltages = [0] * NUMBER_LOCATIONS
+## List that represents the robot's belief of what direction the sound is coming from, holding
+## the probability of each location indexed the same way as locations ##
+belief_probs = [1 / NUMBER_LOCATIONS] * NUMBER_LOCATIONS
 ## Half the number of locations ##
 half_length = int(NUMBER_LOCATIONS / 2)
+## Tuple mapping each location index to the index of the location directly behind it ##
+OPPOSITE_INDEX = tuple((x + half_length) % NUMBER_LOCATIONS for x in range(NUMBER_LOCATIONS))
+## Set of location indices that end a half rotation, where the belief gets updated ##
+END_OF_HALF = {half_length - 1, NUMBER_LOCATIONS - 1}
 ## Location index that keeps track of which angle we are updating as we increment on_step ##
 loc_index = 0
+## Index of the most likely location in belief_probs, updated whenever belief_probs changes ##
+desired_index = most_likely_location()
 
 
 #### Robot functions ####
@@ -146,9 +258,11 @@ def on_load():
     '''
     Executes when loading the robot brain.
     '''
+    global real_robot
+    real_robot = not robot.simulated
     ## Activates or deactivates sonar and sound based on our variables,
     ## only if we are connected to a real robot ##
-    if not robot.simulated:
+    if real_robot:
         robot.arcos.send_command(SOUNDTOG, SENSORS_ON)
         robot.arcos.send_command(SONAR, SENSORS_ON)
         
@@ -169,21 +283,27 @@ def on_step(step_duration):
     global prev_behav
     global INIT_BEHAV
     global locations
-    global loc_belief
-    global loc_dict
+    global belief_probs
+    global desired_index
+    global loc_voltages
     global loc_index
     global half_length
     global to_search
     global voltage_values
+    ## The simulator can't provide analog inputs, so it only runs random movement ##
+    if not real_robot:
+        step_simulated()
+        return
+    ## Reads the sensors once per timestep and passes them to the helpers ##
+    sonars = robot.sonars # Unpack sonar list to keep track of distance from wall
+    front, _2, _3, back = robot.analogs # Unpacks analog mic values from the front and back mics
     ### Operates search procedure ###
-    ## Initiates search if we are in search mode and not simulated (simulator will
-    ## throw error if we try to collect analog inputs from simulated robot) ##
-    if prev_behav == 'search' and not robot.simulated:
+    ## Initiates search if we are in search mode ##
+    if prev_behav == 'search':
         (px, py, ptheta) = robot.pose # Unpacks angle value for use in both belief update and movement
-        front, _2, _3, back = robot.analogs # Unpacks analog mic values for use in belief update
         ## Checks if the average voltage value from the last 10 timesteps is still occurring. If not,
         ## returns to normal behavior ##
-        if update_voltage_values() < 2:
+        if update_voltage_values(front, back) < 2:
             prev_behav = random_behavior()
             return
         ### Belief update ###
@@ -191,19 +311,27 @@ def on_step(step_duration):
         ## division of the unit circle) to record voltage at that position. After each rotation,
         ## it stores these values and updates its belief state. ##
         elif to_search < 2: # Checks to see if we have performed less than two rotations of the robot
-            if abs(ptheta - locations[loc_index]) > ANGLE_TOL:  # Moves the robot to the next angle
+            loc_index, observe = belief_step(ptheta, loc_index)
+            if not observe:  # Moves the robot to the next angle
                 robot.rv = 0.5
                 return
             ## Otherwise, the robot is at an observable angle. Sets the current angle to the front
             ## mic voltage and the corresponding read angle to the back mic voltage ##
             robot.rv = 0
-            loc_index += 1
-            loc_dict[locations[loc_index]] = front 
-            loc_dict[locations[(loc_index + half_length) % (half_length * 2)]] = back
-            if (loc_index + 1) % half_length == 0:  # Robot has finished one rotation, updates belief
+            loc_voltages[loc_index] = front
+            loc_voltages[OPPOSITE_INDEX[loc_index]] = back
+            if loc_index in END_OF_HALF:  # Robot has finished one rotation, updates belief
                 ## Updates the belief probability distribution, giving equal weight to present and
-                ## past observations ##
-                loc_belief = mixture(loc_belief, update_loc_obs(), 0.5)
+                ## past observations. Uses the voltages recorded at each position as the probability
+                ## the other robot is at that position (voltages are normalized first). For example,
+                ## if the loudest sound is at pi radians, the robot will read the highest voltage there
+                ## and then assign that the highest probability mass by dividing all voltage values by
+                ## their sum. Normalizing and mixing are done in a single pass, so scale includes the
+                ## observation's half of the weight ##
+                scale = 0.5 / sum(loc_voltages)
+                for x in range(NUMBER_LOCATIONS):
+                    belief_probs[x] = 0.5 * belief_probs[x] + scale * loc_voltages[x]
+                desired_index = most_likely_location()
                 ## If we have completed a whole revolution, reset the angle counter and
                 ## increment the number of revolutions ##
                 if loc_index == half_length * 2: 
@@ -212,41 +340,37 @@ def on_step(step_duration):
                 return
         ### After two rotations, moves the robot based on its belief state ###
         else:
-            desired_angle = loc_belief.max_prob_elt()  # Desired angle for movement is highest prob
+            desired_angle = locations[desired_index]  # Desired angle for movement is highest prob
             ## If we are at the correct angle but facing an object, associate that angles
             ## probability mass with the angle directly behind it due to sound reflection ##
-            if abs(ptheta - desired_angle) < ANGLE_TOL and is_near_wall(): 
-                ## Unpacks probability distribution into a dict, then calculates the opposite angle,
-                ## reassigns probability masses, creates a new distribution, and chooses the new
-                ## desired angle based on those, new probability masses ##
-                new_belief = {x: loc_belief.prob(x) for x in loc_belief.support()}
-                opposite_angle = locations[(locations.index(desired_angle) + half_length) % (half_length * 2)]
-                new_belief[opposite_angle] = sum((new_belief.get(opposite_angle, 0),
-                                                  new_belief.get(desired_angle, 0)))
-                new_belief[desired_angle] = 0
-                loc_belief = DDist(new_belief)
-                desired_angle = loc_belief.max_prob_elt()
+            if abs(ptheta - desired_angle) < ANGLE_TOL and is_near_wall(sonars):
+                ## Moves the probability mass of the desired angle onto the opposite angle in place,
+                ## then chooses the new desired angle based on those new probability masses ##
+                belief_probs[OPPOSITE_INDEX[desired_index]] += belief_probs[desired_index]
+                belief_probs[desired_index] = 0
+                desired_index = most_likely_location()
+                desired_angle = locations[desired_index]
             ## If we aren't at the correct angle, turn proportionally until we reach it ##
             if abs(ptheta - desired_angle) > ANGLE_TOL:
                 (robot.fv, robot.rv) = (0, -1 * (ptheta - desired_angle))
                 return
             ## Otherwise, we're at the angle but not there, so move forward ##
-            elif not is_near_wall():
+            elif not is_near_wall(sonars):
                 (robot.fv, robot.rv) = (0.5, 0)
                 ## If the robot detects a voltage that is less than the one it previously measured,
                 ## it has moved away from the sound source, so it stops and re-searches ##
-                if (front - loc_dict[desired_angle]) < 0.2: 
+                if (front - loc_voltages[desired_index]) < 0.2:
                     robot.fv = 0
                     to_search = 0
                 return
     ## Operates random movement if the robot hasn't been activated yet ##
     else:
         ## Selects a random behavior based on the probability distribution ## 
-        this_behavior = random_behavior(prev_behav, is_near_wall()) 
+        this_behavior = random_behavior(prev_behav, is_near_wall(sonars))
         consecutives = consecutives + 1 if prev_behav == this_behavior else 0
         ## If the average of the voltage values is greater than 2, initiate search
         ## and activate the search light ##
-        if update_voltage_values() > 2: 
+        if update_voltage_values(front, back) > 2:
             this_behavior = 'search'
             robot.set_analog_voltage(3.3)
         (robot.fv, robot.rv) = BEHAVIOR_DICT[this_behavior] # Sets robots movement based on its new behavior
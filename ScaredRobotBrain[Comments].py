@@ -1,3 +1,6 @@
+import random  # Standard random import for drawing behaviors
+from bisect import bisect_right  # Binary search over cumulative probabilities
+from itertools import accumulate  # Running sums for cumulative probabilities
 ## Special imports from class libraries ##
 from soar.robot.pioneer import PioneerRobot  # Robot controller
 from soar.robot.arcos import *  # Robot functions
@@ -20,33 +23,114 @@ def random_behavior(prev_behav='stay', near_wall=False):
     ## Continue search if we are already searching ##
     if prev_behav == 'search':
         return 'search'
-    ## If we are near a wall, force behavior to give us 'turn' ##
+    ## If we are near a wall, turn. Conditioning behavior on turning can only give 'turn' ##
     elif near_wall:
-        return behavior.condition(lambda x: x not in ('frwd', 'search', 'stay')).draw()
+        return 'turn'
     ## If the previos behavior was the same as the highest probability behavior, we update
     ## the distribution in a way that initially favors the highest probability but declines
     ## over time if the behavior stays the same ##
-    elif prev_behav == behavior.max_prob_elt():
-        behav_elts = behavior.support()  # Returns a list of potential outputs of behavior
-        behav_elts.remove(prev_behav)  # Removes the previous behavior from that list
-        uni_dist = uniform_dist(behav_elts)  # Creates a new uniform distribution over the new list
+    elif prev_behav == behavior_max_elt:
+        ## Uniform distribution over the potential outputs of behavior, without the previous behavior ##
+        uni_dist = UNIFORM_WITHOUT[prev_behav]
         ## Mixes the current behavior distribution with the new uniform one, weighting the
-        ## current distribution so that the two are equally likely after 5000 timesteps ##
-        behavior = mixture(behavior, uni_dist, (10000 - consecutives) / 10000)
-        return behavior.draw()  # Draws and returns a new behavior
+        ## current distribution so that the two are equally likely after 5000 timesteps. After
+        ## 10000 timesteps the weight would reach zero, so behavior just becomes the uniform one ##
+        if consecutives >= 10000:
+            set_behavior(uni_dist)
+        else:
+            mix_behavior(uni_dist, (10000 - consecutives) / 10000)
+        return draw_behavior()  # Draws and returns a new behavior
     ## If the previous behavior wasn't the highest probability behavior, update the
     ## distribution to favor a new chain of behaviors ##
     else: 
         ## Creates a new distribution with all probability mass on the previous behavior ##
-        peak_dist = delta_dist(prev_behav)
+        peak_dist = PEAK_DISTS[prev_behav]
         ## Mixes the current behavior distribution with the new spiked one, weighting the 
         ## current distribution so that it is 1/10 as likely as the spiked distribution. After
         ## four timesteps, the two distributions are equally likely, and after nine, the behavior
         ## won't change. This is to encourage picking a high probability behavior initially, 
         ## but allowing the specific probability mass to sort itself out if it chooses a low 
-        ## probability outcome several times in a row ##
-        behavior = mixture(behavior, peak_dist, min((consecutives + 1) / 10, 1))
-        return behavior.draw()  # Draws and returns a new behavior
+        ## probability outcome several times in a row. Once the weight reaches 1 mixing leaves
+        ## behavior as it is, so it is skipped ##
+        if consecutives < 9:
+            mix_behavior(peak_dist, (consecutives + 1) / 10)
+        return draw_behavior()  # Draws and returns a new behavior
+
+def behavior_probs(dist):
+    '''
+    returns the probabilities a DDist assigns to each behavior, in the same order as
+    BEHAVIORS. this is how behavior distributions are stored so they can be mixed and
+    drawn from without going through DDist.
+    args: DDist
+    ret: tuple
+    '''
+    return tuple(dist.prob(x) for x in BEHAVIORS)
+
+def mix_behavior(other, p):
+    '''
+    mixes the global behavior distribution with another behavior distribution,
+    choosing behavior with probability p and other with probability 1 - p, the
+    same way mixture does for DDists.
+    args: tuple, double
+    ret: 
+    '''
+    q = 1 - p
+    set_behavior(tuple(p * x + q * y for x, y in zip(behavior, other)))
+
+def set_behavior(new_behavior):
+    '''
+    replaces the global behavior distribution and refreshes the values cached from
+    it, so they are only recomputed when the distribution actually changes.
+    args: tuple
+    ret: 
+    '''
+    global behavior
+    global behavior_max_elt
+    global behavior_cumulative
+    behavior = new_behavior
+    behavior_max_elt = BEHAVIORS[new_behavior.index(max(new_behavior))]  # Most likely behavior
+    behavior_cumulative = tuple(accumulate(new_behavior))  # Running totals used by draw_behavior
+
+def draw_behavior():
+    '''
+    draws a random behavior from the global behavior distribution. uses the
+    cumulative probabilities cached by set_behavior, so each draw is one random
+    number and a binary search.
+    args: 
+    ret: string
+    '''
+    index = bisect_right(behavior_cumulative, random.random())
+    ## Rounding can leave the last running total slightly below 1, so clamp to the last behavior ##
+    return BEHAVIORS[min(index, len(BEHAVIORS) - 1)]
+
+def is_near_wall(sonars):
+    '''
+    checks to see if the robot is too close to a wall or another object based on
+    its sonar readings from the middle six sonars. returns True if the robot 
+    is within the defined wall_dist, False if it is farther away.
+    args: list
+    ret: boolean
+    '''
+    ## Checks to see if any of the sensors is close enough to warrant a close reading, stopping
+    ## at the first one. Sensors with no reading return None and are skipped ##
+    for distance in sonars[1:6]:
+        if distance is not None and distance < WALL_DISTANCE:
+            return True
+    return False
+
+def step_simulated():
+    '''
+    runs one timestep of random movement on a simulated robot. the simulator has no
+    analog inputs, so this skips the search procedure entirely.
+    args: 
+    ret: 
+    '''
+    global consecutives
+    global prev_behav
+    this_behavior = random_behavior(prev_behav, is_near_wall(robot.sonars))
+    consecutives += 1 if prev_behav == this_behavior else -consecutives
+    (robot.fv, robot.rv) = BEHAVIOR_DICT[this_behavior] # Sets robots movement based on its new behavior
+    prev_behav = this_behavior
     
     
     
@@ -65,17 +149,34 @@ SENSORS_ON = 1 # 0 for False, 1 for True
 ## The initial distribution for robot behaviors. Favored to behaviors besides search to encourage
 ## period of random movement before beginning of search ##
 BEHAV_DIST_1 = DDist({'stay': 0.33, 'frwd': 0.33, 'turn': 0.33, 'search': 0.01})
+## Tuple of every behavior random_behavior can pick. Behavior distributions are stored as tuples
+## of probabilities in this order ##
+BEHAVIORS = tuple(BEHAV_DIST_1.support())
+## Uniform distributions over every behavior but one, and distributions with all probability
+## mass on one behavior, keyed by that behavior. The behaviors never change, so these are
+## built once instead of on every call to random_behavior ##
+UNIFORM_WITHOUT = {b: behavior_probs(uniform_dist([x for x in BEHAVIORS if x != b])) for b in BEHAVIORS}
+PEAK_DISTS = {b: behavior_probs(delta_dist(b)) for b in BEHAVIORS}
+## Probabilities of the initial distribution, in the form behavior is stored in ##
+BEHAV_PROBS_1 = behavior_probs(BEHAV_DIST_1)
 ## Double that allows us to set the distance we want the robot to keep from any walls
 WALL_DISTANCE = 0.5 # meters
 
 ## Behavior variable that is passed around functions. Initialized to inital
 ## robot probability distribution ##
-behavior = BEHAV_DIST_1
+behavior = BEHAV_PROBS_1
+## Values cached from behavior by set_behavior, which fills them in from the initial distribution ##
+behavior_max_elt = None
+behavior_cumulative = ()
+set_behavior(BEHAV_PROBS_1)
 ## Integer that keeps track of the number of the same consective movements to help
 ## create a more realistic movement model ##
 consecutives = 0
 ## Initializes previous behavior variable. Set to 'search' to immediately initiate search ##
 prev_behav = 'stay'
+## Boolean that is True when connected to a real robot. Set once in on_load, since it can't
+## change while the brain is running ##
+real_robot = False
 
 
 
@@ -85,9 +186,11 @@ def on_load():
     '''
     Executes when loading the robot brain.
     '''
+    global real_robot
+    real_robot = not robot.simulated
     ## Activates or deactivates sonar and sound based on our variables,
     ## only if we are connected to a real robot ##
-    if not robot.simulated:
+    if real_robot:
         robot.arcos.send_command(SOUNDTOG, SENSORS_ON)
         robot.arcos.send_command(SONAR, SENSORS_ON)
         
@@ -106,11 +209,14 @@ def on_step(step_duration):
     global behavior
     global consecutives
     global prev_behav
-    global BEHAV_DIST_1
+    global BEHAV_PROBS_1
+    ## The simulator can't provide analog inputs, so it only runs random movement ##
+    if not real_robot:
+        step_simulated()
+        return
     sonars = robot.sonars # Unpack sonar list to keep track of distance from wall
-    ## Initiates search if we are in search mode and not simulated (simulator will
-    ## throw error if we try to collect analog inputs from simulated robot) ##
-    if prev_behav == 'search' and not robot.simulated:
+    ## Initiates search if we are in search mode ##
+    if prev_behav == 'search':
         (robot.fv, robot.rv) = (0, 0) # Sets the fv and rv of the robot to 0
         ## Left to right - Analog inputs 1, 2, 3, 4. Voltages from the head
         ## are defined on 1, 2, 3. We use 2 and 3. ##
@@ -118,14 +224,14 @@ def on_step(step_duration):
         robot.set_analog_voltage(10) # Activates sound device to signal other robot
         ## Looks for a close enough IR signal. If a signal is found, that means the other robot is nearby
         if v_left > 0.5 or v_right > 0.5:
-            behavior = BEHAV_DIST_1 # After search is concluded, returns to random movement
+            set_behavior(BEHAV_PROBS_1) # After search is concluded, returns to random movement
             robot.set_analog_voltage(0) # Disables the sound device
             prev_behav = 'stay' # Re-initializes the previous behavior to allow for random behavior
     else: # Continues random movement if not searching
         ## Checks to see if robot is near a wall, passed to random_behavior ##
-        is_near_wall = any([sonars[x] < WALL_DISTANCE for x in range(1, 6) if sonars[x] != None])
+        near_wall = is_near_wall(sonars)
         ## Chooses a new behavior using random_behavior ##
-        this_behavior = random_behavior(prev_behav, is_near_wall)
+        this_behavior = random_behavior(prev_behav, near_wall)
         ## If the new behavior and the old behavior are the same, inrement the consecutive tracker.
         ## Otherwise, reset it ##
         consecutives += 1 if prev_behav == this_behavior else -consecutives
@@ -139,7 +245,7 @@ def on_stop():
     '''
     ## If we stop the behavior of the robot, disables the
     ## sound device to prevent undesired continued operation ##
-    if not robot.simulated:
+    if real_robot:
         robot.set_analog_voltage(0)
 
 def on_shutdown():